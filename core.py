@@ -1,41 +1,88 @@
 import asyncio
+import codecs
 import json
 import logging
+import os
 import re
+import sys
 from base64 import b64encode
-from time import time
+from time import monotonic, time
 from collections import abc
-from datetime import datetime, timezone
-from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, suppress
 from typing import Any, Dict, Optional
+from urllib.parse import quote, quote_from_bytes
 import aiohttp
 from yarl import URL
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- Утилиты и Константы ---
+logger = logging.getLogger(__name__)
 JsonType = Dict[str, Any]
 
 class MinerException(Exception): pass
 class GQLException(MinerException): pass
 class RequestException(MinerException): pass
 
-def timestamp(stamp: str) -> datetime:
-    try: 
-        return datetime.fromisoformat(stamp.replace('Z', "+00:00"))
-    except ValueError: 
-        return datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+if sys.version_info >= (3, 11):
+    # С Python 3.11 fromisoformat понимает суффикс 'Z' сам
+    def timestamp(stamp: str) -> datetime:
+        return datetime.fromisoformat(stamp)
+else:
+    def timestamp(stamp: str) -> datetime:
+        if stamp.endswith("Z"):
+            return datetime.fromisoformat(stamp[:-1] + "+00:00")
+        return datetime.fromisoformat(stamp)
+
+# Сериализатор JSON: orjson, если установлен, иначе стандартный json
+if orjson is not None:
+    def _dumps(data: Any) -> str:
+        # orjson сразу выдает минифицированный JSON
+        return orjson.dumps(data).decode()
+    def _dumps_pretty(data: Any) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    _loads = orjson.loads
+else:
+    def _dumps(data: Any) -> str:
+        return json.dumps(data, separators=(',', ':'))
+    def _dumps_pretty(data: Any) -> bytes:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode()
+    _loads = json.loads
 
 def json_minify(data: Any) -> str: 
-    return json.dumps(data, separators=(',', ':'))
-
-class ExponentialBackoff:
-    def __init__(self, base: float = 1.0, *, maximum: float = 60.0):
-        self._base = base
-        self._exp = 0
-        self._max = maximum
-    def __iter__(self): return self
-    def __next__(self) -> float: 
-        self._exp += 1
-        return min(self._base * 2 ** self._exp, self._max)
+    return _dumps(data)
+
+def json_loads(data: bytes | str) -> Any:
+    return _loads(data)
+
+def read_json_file(path: str) -> Any:
+    """Прочитать JSON-файл (accounts.json, headers.json и т.п.)."""
+    with open(path, "rb") as f:
+        return _loads(f.read())
+
+def write_json_file(path: str, data: Any):
+    """Сохранить данные в JSON-файл с отступами, без экранирования не-ASCII символов."""
+    # Пишем во временный файл и подменяем им исходный, чтобы не испортить его при прерывании
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_dumps_pretty(data))
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=1)
+def _load_headers_json() -> JsonType:
+    # headers.json общий для всех аккаунтов - читаем его один раз за процесс
+    try:
+        return read_json_file("headers.json")
+    except FileNotFoundError:
+        return {}
+
+# Задержки между повторами запроса (экспоненциальный рост до 60 секунд)
+_BACKOFF_SCHEDULE = tuple(min(2.0 ** i, 60.0) for i in range(1, 8))
 
 class ClientInfo:
     def __init__(self, client_id: str, user_agent: str): 
@@ -55,14 +102,13 @@ class GQLOperation(dict):
         if variables is not None: 
             self["variables"] = variables
             
-    def with_variables(self, variables: JsonType) -> "GQLOperation":
-        new_vars = self.get("variables", {}).copy()
-        new_vars.update(variables)
-        return GQLOperation(
-            self["operationName"], 
-            self["extensions"]["persistedQuery"]["sha256Hash"], 
-            variables=new_vars
-        )
+    def with_variables(self, variables: JsonType) -> JsonType:
+        # Базовая операция не изменяется, поэтому extensions переиспользуем по ссылке
+        if "variables" in self:
+            variables = {**self["variables"], **variables}
+        return {**self, "variables": variables}
+
+GQL_URL = "https://gql.twitch.tv/gql"
 
 # Используем правильный хэш из браузера
 GQL_OPERATIONS = {
@@ -77,8 +123,76 @@ GQL_OPERATIONS = {
     "Current_user": GQLOperation("Current_user", "04e4285478e023aa314391066046e4777a0877d84c57429049d61951ef621ec7"), # Попробуем этот хэш
 }
 WATCH_INTERVAL = 60 # секунд
+STREAM_REFRESH_INTERVALS = 5 # раз в сколько интервалов просмотра обновлять информацию о стриме
+
+# Кэш spade_url на диске, чтобы не искать его заново после перезапуска
+SPADE_CACHE_FILE = "spade_cache.json"
+SPADE_CACHE_TTL = 6 * 60 * 60 # секунд
+SPADE_CACHE_SAVE_DELAY = 60 # секунд
+
+# Паттерн для поиска spade_url (компилируется один раз при импорте).
+# Обе альтернативы ищутся за один проход по тексту страницы
+_SPADE_COMBINED = re.compile(
+    r'"spade_?url":\s*"(?P<a>[^"]+)"|(?P<b>https://video-edge-[^\s"<>]+\.ts(?:\?[^\s"<>]+)?)',
+    re.IGNORECASE
+)
+# Неизменные параметры запроса плейлиста usher (sig и token подставляются отдельно)
+_USHER_CONST_PARAMS = "allow_source=true&allow_audio_only=true&allow_spectre=false&player=twitchweb&playlist_include_framerate=true"
+
+# Сколько символов конца прочитанного куска повторно просматривать вместе со следующим
+_SPADE_SCAN_OVERLAP = 1024
+
+def _has_spade_marker(text: str) -> bool:
+    # Быстрая проверка маркеров, чтобы не гонять regex впустую
+    # (без учета регистра, как и сам regex)
+    lowered = text.lower()
+    return "spade" in lowered or "video-edge-" in lowered
+
+class _SpadeScanner:
+    """Поиск spade_url в HTML страницы, читаемом по частям.
+
+    Ключ "spade_url" приоритетнее ссылки на сегмент video-edge-...ts:
+    ссылка только запоминается как запасной вариант, а ключ ищется до конца страницы.
+    """
+    __slots__ = ('_decoder', '_tail', 'fallback')
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._tail = ""
+        self.fallback: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> Optional[str]:
+        """Обработать очередной кусок; вернуть spade_url, если найден ключ."""
+        return self._scan(self._tail + self._decoder.decode(chunk), final=False)
+
+    def finish(self) -> Optional[str]:
+        """Обработать остаток страницы; вернуть spade_url или запасную ссылку."""
+        return self._scan(self._tail + self._decoder.decode(b"", final=True), final=True) or self.fallback
+
+    def _scan(self, window: str, final: bool) -> Optional[str]:
+        # Конец окна просматриваем еще раз вместе со следующим куском
+        keep_from = len(window) - _SPADE_SCAN_OVERLAP
+        if _has_spade_marker(window):
+            # Один проход: ключ возвращаем сразу, первую ссылку - запоминаем
+            for match in _SPADE_COMBINED.finditer(window):
+                if match.group("a"):
+                    # Ключ ограничен кавычками, поэтому найденное значение уже полное
+                    return match.group("a")
+                if self.fallback is None:
+                    if final or len(window) - match.end() >= _SPADE_SCAN_OVERLAP:
+                        self.fallback = match.group("b")
+                    else:
+                        # Ссылка у конца окна может продолжиться (например, после "?"):
+                        # переносим ее целиком и проверяем вместе со следующим куском
+                        keep_from = min(keep_from, match.start())
+        self._tail = window[max(keep_from, 0):]
+        return None
+
+_SPADE_IN_PLAYLIST = re.compile(r'"spade_?url":\s*"([^"]+)"', re.IGNORECASE)
 
 class Game:
+    __slots__ = ('id', 'name', 'slug')
+
     def __init__(self, data: JsonType): 
         self.id: str = data["id"]
         self.name: str = data["displayName"]
@@ -89,6 +203,8 @@ class Game:
         return hash(self.name)
 
 class TimedDrop:
+    __slots__ = ('_worker', 'campaign', 'id', 'claim_id', 'is_claimed', 'current_minutes', 'required_minutes')
+
     def __init__(self, campaign: "DropsCampaign", data: JsonType):
         self._worker = campaign._worker
         self.campaign = campaign
@@ -115,11 +231,18 @@ class TimedDrop:
             )
             self.is_claimed = True
             self.current_minutes = self.required_minutes
+            self.campaign._finished_cache = None
+            self._worker._update_earnable_games()
             self._worker.log(f"Claimed drop for '{self.campaign.name}'")
         except GQLException: 
             self._worker.log(f"Failed to claim drop {self.id}")
 
 class DropsCampaign:
+    __slots__ = (
+        '_worker', 'id', 'name', 'game', 'linked', 'starts_at', 'ends_at',
+        '_starts_ts', '_ends_ts', 'timed_drops', '_finished_cache'
+    )
+
     def __init__(self, worker: "AccountWorker", data: JsonType):
         self._worker = worker
         self.id: str = data["id"]
@@ -129,24 +252,31 @@ class DropsCampaign:
         self.linked: bool = True
         self.starts_at = timestamp(data["startAt"])
         self.ends_at = timestamp(data["endAt"])
+        # Границы кампании в epoch-секундах для быстрых сравнений в active
+        self._starts_ts = self.starts_at.timestamp()
+        self._ends_ts = self.ends_at.timestamp()
         
         # Обрабатываем дропы
         raw_drops = data.get("timeBasedDrops", [])
         self.timed_drops: dict[str, TimedDrop] = {d["id"]: TimedDrop(self, d) for d in raw_drops}
+        # Кэш признака "все дропы получены", сбрасывается при получении дропа
+        self._finished_cache: Optional[bool] = all(d.is_claimed for d in self.timed_drops.values())
         
     @property
     def active(self) -> bool: 
-        now = datetime.now(timezone.utc)
-        return self.starts_at <= now < self.ends_at
+        now_ts = self._worker._cached_now()
+        return self._starts_ts <= now_ts < self._ends_ts
         
     @property
     def finished(self) -> bool:
         # Если дропов нет в API, считаем, что кампания не завершена
         if not self.timed_drops:
-            self._worker.log(f"Campaign '{self.name}' has no drops from API, assuming not finished for farming.")
+            self._worker.debug("Campaign '%s' has no drops from API, assuming not finished for farming.", self.name)
             return False # Кампания не завершена, можно фармить
-        result = all(d.is_claimed for d in self.timed_drops.values())
-        self._worker.log(f"Campaign '{self.name}' finished check (with drops): all claimed = {result}")
+        if self._finished_cache is None:
+            self._finished_cache = all(d.is_claimed for d in self.timed_drops.values())
+        result = self._finished_cache
+        self._worker.debug("Campaign '%s' finished check (with drops): all claimed = %s", self.name, result)
         return result
         
     def can_earn(self) -> bool:
@@ -154,18 +284,29 @@ class DropsCampaign:
         is_active = self.active
         is_not_finished = not self.finished
         result = is_active and is_not_finished
-        self._worker.log(f"Campaign '{self.name}' can_earn: active={is_active}, not_finished={is_not_finished} = {result}")
+        self._worker.debug("Campaign '%s' can_earn: active=%s, not_finished=%s = %s", self.name, is_active, is_not_finished, result)
         return result
 
 class Stream:
+    __slots__ = ('channel', 'broadcast_id', 'game', '_payload_prefix', '_payload_suffix')
+
     def __init__(self, channel: "Channel", user_data: JsonType):
         self.channel = channel
         self.broadcast_id = user_data.get("stream", {}).get("id", "0")
         self.game = Game(user_data.get("broadcastSettings", {}).get("game", {})) if user_data.get("broadcastSettings", {}).get("game") else None
-        
-    @property
-    def spade_payload(self) -> JsonType:
-        payload = {
+        # Payload меняется только в timestamp - сериализуем его один раз,
+        # а при отправке подставляем текущее время между префиксом и суффиксом
+        self._payload_prefix: Optional[bytes] = None
+        self._payload_suffix: Optional[bytes] = None
+        marker = b'"timestamp":0'
+        raw = json_minify(self._build_payload(0)).encode()
+        if raw.count(marker) == 1:
+            head, tail = raw.split(marker)
+            self._payload_prefix = head + b'"timestamp":'
+            self._payload_suffix = tail
+
+    def _build_payload(self, stamp: int) -> JsonType:
+        return {
             "event": "minute-watched",
             "properties": {
                 "broadcast_id": str(self.broadcast_id),
@@ -179,13 +320,24 @@ class Stream:
                 "player": "site",
                 "user_id": str(self.channel._worker.user_id),
                 "platform": "web",
-                "timestamp": int(time() * 1000)
+                "timestamp": stamp
             }
         }
-        encoded = b64encode(json_minify(payload).encode()).decode()
-        return {"data": encoded}
+
+    @property
+    def spade_payload(self) -> bytes:
+        """Готовое тело запроса: data=<base64 payload> в form-urlencoded виде."""
+        stamp = int(time() * 1000)
+        if self._payload_prefix is not None:
+            raw = self._payload_prefix + str(stamp).encode() + self._payload_suffix
+        else:
+            raw = json_minify(self._build_payload(stamp)).encode()
+        # Экранируем '+', '/' и '=' из base64 так же, как это делает кодирование формы
+        return b"data=" + quote_from_bytes(b64encode(raw), safe="").encode()
 
 class Channel:
+    __slots__ = ('_worker', 'id', 'login', 'display_name', 'game', '_stream', '_spade_url')
+
     def __init__(self, worker: "AccountWorker", id: int, login: str, display_name: str, game: Game):
         self._worker = worker
         self.id = id
@@ -209,9 +361,11 @@ class Channel:
     async def update_stream(self) -> bool:
         """Обновить информацию о стриме."""
         try:
-            res = await self._worker.gql_request(
-                GQL_OPERATIONS["GetStreamInfo"].with_variables({"channel": self.login})
-            )
+            # Ограничиваем число одновременных запросов, чтобы не упереться в лимиты Twitch
+            async with self._worker._stream_semaphore:
+                res = await self._worker.gql_request(
+                    GQL_OPERATIONS["GetStreamInfo"].with_variables({"channel": self.login})
+                )
             stream_data = res.get("data", {}).get("user", {}).get("stream")
             if stream_data:
                 self._stream = Stream(self, res["data"]["user"])
@@ -222,29 +376,38 @@ class Channel:
             self._stream = None
             return False
 
+    def _set_spade_url(self, spade_url: str) -> URL:
+        self._spade_url = URL(spade_url)
+        self._worker._remember_spade_url(self.login, spade_url)
+        return self._spade_url
+
     async def get_spade_url(self) -> str:
         """Получить URL для отправки watch-событий."""
         if self._spade_url:
             return self._spade_url
 
-        # Метод 1: Ищем в HTML страницы канала
+        # Метод 0: Берем из кэша, если запись еще не устарела
+        cached = self._worker._spade_cache.get(self.login)
+        if cached and cached[1] > time():
+            self._spade_url = URL(cached[0])
+            return self._spade_url
+
+        # Метод 1: Ищем в HTML страницы канала, читая ее по частям
+        # и прекращая чтение, как только нашли ключ spade_url
         url = URL(f"https://www.twitch.tv/{self.login}")
+        scanner = _SpadeScanner()
         async with self._worker.request("GET", url) as response:
-            text = await response.text()
+            async for chunk in response.content.iter_chunked(16384):
+                spade_url = scanner.feed(chunk)
+                if spade_url:
+                    break
+            else:
+                spade_url = scanner.finish()
 
-        # Попробуем несколько паттернов
-        patterns = [
-            r'"spade_?url":\s*"([^"]+)"',
-            r'(https://video-edge-[^\s"<>]+\.ts(?:\?[^\s"<>"]+)?)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                spade_url = match.group(1).replace('\\u0025', '%')
-                self._worker.log(f"Найден spade_url для {self.login}: {spade_url[:100]}...")
-                self._spade_url = URL(spade_url)
-                return self._spade_url
+        if spade_url:
+            spade_url = spade_url.replace('\\u0025', '%')
+            self._worker.log(f"Найден spade_url для {self.login}: {spade_url[:100]}...")
+            return self._set_spade_url(spade_url)
 
         # Метод 2: Fallback через GQL (PlaybackAccessToken)
         try:
@@ -262,26 +425,20 @@ class Channel:
                 token_value = token_data.get("value", "")
                 if signature and token_value:
                     # Запрашиваем список доступных потоков
-                    playlist_url = URL(f"https://usher.ttvnw.net/api/channel/hls/{self.login}.m3u8") \
-                        .with_query({
-                            "sig": signature,
-                            "token": token_value,
-                            "allow_source": "true",
-                            "allow_audio_only": "true",
-                            "allow_spectre": "false",
-                            "player": "twitchweb",
-                            "playlist_include_framerate": "true"
-                        })
+                    playlist_url = URL(
+                        f"https://usher.ttvnw.net/api/channel/hls/{self.login}.m3u8"
+                        f"?sig={quote(signature, safe='')}&token={quote(token_value, safe='')}&{_USHER_CONST_PARAMS}",
+                        encoded=True
+                    )
                     
                     async with self._worker.request("GET", playlist_url) as playlist_resp:
                         playlist_text = await playlist_resp.text()
                         # Ищем spade_url в плейлисте (иногда бывает там)
-                        match = re.search(r'"spade_?url":\s*"([^"]+)"', playlist_text, re.IGNORECASE)
+                        match = _SPADE_IN_PLAYLIST.search(playlist_text)
                         if match:
                             spade_url = match.group(1).replace('\\u0025', '%')
                             self._worker.log(f"Fallback GQL spade_url для {self.login}: {spade_url[:100]}...")
-                            self._spade_url = URL(spade_url)
-                            return self._spade_url
+                            return self._set_spade_url(spade_url)
                             
                         # Если не нашли, используем первый доступный поток как индикатор активности
                         # и пытаемся получить spade_url другим способом
@@ -295,8 +452,7 @@ class Channel:
                                 base_url = stream_url.split('/index')[0]
                                 spade_url = f"{base_url}/ping"
                                 self._worker.log(f"Создан spade_url для {self.login}: {spade_url}")
-                                self._spade_url = URL(spade_url)
-                                return self._spade_url
+                                return self._set_spade_url(spade_url)
                                 
         except Exception as e:
             self._worker.log(f"Ошибка fallback GQL для {self.login}: {e}")
@@ -314,7 +470,7 @@ class Channel:
                 self._spade_url = await self.get_spade_url()
             
             payload = self._stream.spade_payload
-            self._worker.log(f"Отправка watch для {self.login} на {self._spade_url}")
+            self._worker.debug("Отправка watch для %s на %s", self.login, self._spade_url)
             
             async with self._worker.request(
                 "POST",
@@ -322,9 +478,14 @@ class Channel:
                 data=payload,
                 headers={"Content-Type": "text/plain;charset=UTF-8"}
             ) as response:
-                self._worker.log(f"Ответ watch для {self.login}: {response.status}")
+                self._worker.debug("Ответ watch для %s: %s", self.login, response.status)
                 # Twitch может возвращать 204 No Content или 200 OK
-                return response.status in (204, 200)
+                if response.status in (204, 200):
+                    return True
+            # spade_url мог устареть - в следующий раз получим его заново
+            self._spade_url = None
+            self._worker._forget_spade_url(self.login)
+            return False
                 
         except Exception as e:
             self._worker.log(f"Ошибка watch для {self.login}: {e}")
@@ -341,17 +502,34 @@ class AccountWorker:
             "exclude": set(account_config.get("exclude_games", []))
         }
         self._client_type = ClientType.WEB # Используем WEB клиент
+        # Заголовки GQL запросов не меняются за время жизни работника
+        self._gql_headers = {"Client-Id": self._client_type.CLIENT_ID}
+        # Для GQL также добавляем Authorization, если есть auth_token
+        if "auth_token" in account_config:
+            self._gql_headers["Authorization"] = f"OAuth {account_config['auth_token']}"
         self._session: Optional[aiohttp.ClientSession] = None
         self.user_id: Optional[int] = None
         self.inventory: list[DropsCampaign] = []
+        self._game_by_name: dict[str, Game] = {}
+        # Игры, по которым сейчас можно получить дропы
+        self._earnable_games: set[Game] = set()
+        # login -> (spade_url, время истечения записи)
+        self._spade_cache: dict[str, tuple[str, float]] = self._read_spade_cache_file()
+        self._spade_cache_dropped: set[str] = set()
+        self._spade_cache_task: Optional[asyncio.Task] = None
         self.channels: dict[int, Channel] = {}
         self.watching_channel: Optional[Channel] = None
         self._watching_task: Optional[asyncio.Task] = None
+        # Устанавливается, когда просмотр канала завершен или остановлен
+        self._watch_stopped = asyncio.Event()
+        # Сигнал текущему циклу просмотра: остановиться или переключиться на другой канал
+        self._switch_event = asyncio.Event()
         self._is_running = True
+        self._stream_semaphore = asyncio.Semaphore(8)
+        # Кэш текущего времени: (monotonic-момент проверки, epoch-время)
+        self._now_cache: tuple[float, float] = (float("-inf"), 0.0)
 
         # Читаем значения заголовков из конфигурационных файлов
-        headers_cfg = {}
-
         # Значения могут быть заданы в accounts.json для конкретного аккаунта
         self._client_integrity = (
             account_config.get("Client-Integrity")
@@ -371,11 +549,7 @@ class AccountWorker:
 
         # Если в accounts.json их нет, пробуем headers.json
         if not all([self._client_integrity, self._client_version, self._device_id]):
-            try:
-                with open("headers.json", "r", encoding="utf-8") as f:
-                    headers_cfg = json.load(f)
-            except FileNotFoundError:
-                headers_cfg = {}
+            headers_cfg = _load_headers_json()
 
             self._client_integrity = self._client_integrity or headers_cfg.get("Client-Integrity")
             self._client_version = self._client_version or headers_cfg.get("Client-Version")
@@ -383,14 +557,73 @@ class AccountWorker:
 
         # Сообщаем пользователю об отсутствующих заголовках
         if not self._client_integrity:
-            logging.warning(f"[{self.username}] Client-Integrity не найден в headers.json или accounts.json")
+            logger.warning(f"[{self.username}] Client-Integrity не найден в headers.json или accounts.json")
         if not self._client_version:
-            logging.warning(f"[{self.username}] Client-Version не найден в headers.json или accounts.json")
+            logger.warning(f"[{self.username}] Client-Version не найден в headers.json или accounts.json")
         if not self._device_id:
-            logging.warning(f"[{self.username}] X-Device-Id не найден в headers.json или accounts.json")
+            logger.warning(f"[{self.username}] X-Device-Id не найден в headers.json или accounts.json")
 
     def log(self, message: str): 
-        logging.info(f"[{self.username}] {message}")
+        logger.info("[%s] %s", self.username, message)
+
+    def debug(self, message: str, *args):
+        # Форматирование ленивое: строка собирается, только если DEBUG включен
+        logger.debug("[%s] " + message, self.username, *args)
+
+    def _cached_now(self, ttl: float = 1.0) -> float:
+        """Текущее epoch-время, обновляемое не чаще раза в ttl секунд."""
+        mono = monotonic()
+        checked_at, now_ts = self._now_cache
+        if mono - checked_at >= ttl:
+            now_ts = time()
+            self._now_cache = (mono, now_ts)
+        return now_ts
+
+    @staticmethod
+    def _read_spade_cache_file() -> dict[str, tuple[str, float]]:
+        try:
+            raw = read_json_file(SPADE_CACHE_FILE)
+            now = time()
+            return {login: (url, expires) for login, (url, expires) in raw.items() if expires > now}
+        except (OSError, ValueError, TypeError, AttributeError):
+            # Нет файла или он поврежден - начинаем с пустого кэша
+            return {}
+
+    def _save_spade_cache(self):
+        # Файл общий для всех аккаунтов - объединяем свои записи с уже сохраненными
+        cache = self._read_spade_cache_file()
+        for login in self._spade_cache_dropped:
+            cache.pop(login, None)
+        cache.update(self._spade_cache)
+        try:
+            write_json_file(SPADE_CACHE_FILE, cache)
+        except OSError as e:
+            self.log(f"Не удалось сохранить кэш spade_url: {e}")
+
+    async def _save_spade_cache_later(self):
+        await asyncio.sleep(SPADE_CACHE_SAVE_DELAY)
+        save = asyncio.ensure_future(asyncio.to_thread(self._save_spade_cache))
+        try:
+            await asyncio.shield(save)
+        except asyncio.CancelledError:
+            # Поток с записью не отменить - дожидаемся его, чтобы stop() не писал файл параллельно
+            await save
+            raise
+
+    def _schedule_spade_cache_save(self):
+        # Откладываем запись, чтобы несколько изменений попали в один save
+        if self._spade_cache_task is None or self._spade_cache_task.done():
+            self._spade_cache_task = asyncio.create_task(self._save_spade_cache_later())
+
+    def _remember_spade_url(self, login: str, spade_url: str):
+        self._spade_cache[login] = (spade_url, time() + SPADE_CACHE_TTL)
+        self._spade_cache_dropped.discard(login)
+        self._schedule_spade_cache_save()
+
+    def _forget_spade_url(self, login: str):
+        if self._spade_cache.pop(login, None) is not None:
+            self._spade_cache_dropped.add(login)
+            self._schedule_spade_cache_save()
 
     async def get_session(self) -> aiohttp.ClientSession:
         if self._session and not self._session.closed: 
@@ -422,14 +655,30 @@ class AccountWorker:
         if self._device_id:
             headers["X-Device-Id"] = self._device_id
         
+        # Держим соединения открытыми и кэшируем DNS между запросами
+        connector = aiohttp.TCPConnector(
+            limit=64,
+            limit_per_host=8,
+            ttl_dns_cache=600,
+            keepalive_timeout=75.0,
+            enable_cleanup_closed=True
+        )
         self._session = aiohttp.ClientSession(
+            connector=connector,
             cookie_jar=jar, 
-            headers=headers
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=20),
+            json_serialize=_dumps,
+            # Буфер чтения вдвое больше стандартных 64 КиБ: крупные ответы (кампании, инвентарь,
+            # HTML страницы канала) принимаются с меньшим числом пауз чтения из сокета
+            read_bufsize=2**17
         )
         return self._session
 
     async def _initialize_session(self):
         self.log("Инициализация сессии...")
+        # Единая сессия с пулом соединений для всех запросов работника (GQL, watch, spade_url)
+        await self.get_session()
         # Проверяем, есть ли auth_token в конфиге
         if "auth_token" in self.config:
             # Используем старый способ для валидации
@@ -439,7 +688,7 @@ class AccountWorker:
                 self.log(f"Ответ валидации: статус {resp.status}")
                 if resp.status == 401: 
                     raise MinerException(f"Auth token для {self.username} недействителен или истек.")
-                data = await resp.json()
+                data = _loads(await resp.read())
                 self.user_id = int(data["user_id"])
                 if not self.username:
                     self.username = data.get("login")
@@ -467,26 +716,12 @@ class AccountWorker:
         session = await self.get_session()
         if self.proxy and "proxy" not in kwargs: 
             kwargs["proxy"] = str(self.proxy)
-            
-        # Добавляем Client-Id header для GQL запросов
-        if str(url).startswith("https://gql.twitch.tv/gql"):
-            if "headers" not in kwargs:
-                kwargs["headers"] = {}
-            kwargs["headers"]["Client-Id"] = self._client_type.CLIENT_ID
-            # Для GQL также добавляем Authorization, если есть auth_token
-            if "auth_token" in self.config:
-                kwargs["headers"]["Authorization"] = f"OAuth {self.config['auth_token']}"
-            
-        backoff = ExponentialBackoff()
-        for delay in backoff:
+
+        for delay in _BACKOFF_SCHEDULE:
             try:
-                self.log(f"Отправка {method} запроса к {url}")
-                async with session.request(
-                    method, url, 
-                    timeout=aiohttp.ClientTimeout(total=20), 
-                    **kwargs
-                ) as response:
-                    self.log(f"Ответ от {url}: статус {response.status}")
+                self.debug("Отправка %s запроса к %s", method, url)
+                async with session.request(method, url, **kwargs) as response:
+                    self.debug("Ответ от %s: статус %s", url, response.status)
                     if response.status >= 500: 
                         self.log(f"Серверная ошибка {response.status}, повтор через {delay}с")
                         await asyncio.sleep(delay)
@@ -498,32 +733,54 @@ class AccountWorker:
                 await asyncio.sleep(delay)
         raise RequestException("Запрос не удался после нескольких попыток.")
 
-    async def gql_request(self, ops: GQLOperation | list[JsonType]) -> JsonType | list[JsonType]:
-        self.log(f"Отправка GQL запроса: {ops.get('operationName', 'Unknown') if isinstance(ops, dict) else 'Batch'}")
-        # Заголовки добавляются в методе request
-        async with self.request("POST", "https://gql.twitch.tv/gql", json=ops) as response:
-            try:
-                resp_json = await response.json()
-                # self.log(f"Ответ GQL: {resp_json}") # Убираем подробный лог ответа для экономии места
-                if errors := (resp_json.get('errors') if isinstance(resp_json, dict) else None):
-                    error_msg = errors[0].get("message", "Неизвестная GQL ошибка")
-                    self.log(f"GQL ошибка: {error_msg}")
-                    # Проверяем специфичную ошибку целостности
-                    if "integrity" in error_msg.lower():
-                        self.log("Ошибка целостности. Попробуйте обновить Client-Integrity или использовать cookies.")
-                    raise GQLException(error_msg)
-                return resp_json
-            except aiohttp.ContentTypeError:
-                # Если ответ не JSON, логируем текст
-                text = await response.text()
-                self.log(f"Текст ответа GQL (не JSON): {text}")
-                raise GQLException(f"Неверный формат ответа: {text}")
+    def _gql_post(self, body: Any) -> AbstractAsyncContextManager[aiohttp.ClientResponse]:
+        return self.request("POST", GQL_URL, json=body, headers=self._gql_headers)
+
+    async def gql_request(self, ops: JsonType | list[JsonType]) -> JsonType | list[JsonType]:
+        self.debug("Отправка GQL запроса: %s", ops.get('operationName', 'Unknown') if isinstance(ops, dict) else 'Batch')
+        # Заголовки GQL подставляются в _gql_post
+        async with self._gql_post(ops) as response:
+            # Читаем тело один раз и разбираем сами, без проверки content-type в aiohttp
+            body = await response.read()
+        try:
+            resp_json = _loads(body)
+        except ValueError:
+            # Если ответ не JSON, логируем начало тела
+            self.log(f"Текст ответа GQL (не JSON): {body[:200]!r}")
+            raise GQLException(f"Неверный формат ответа: {body[:200]!r}")
+        # self.log(f"Ответ GQL: {resp_json}") # Убираем подробный лог ответа для экономии места
+        if isinstance(ops, list):
+            # На пакетный запрос Twitch отвечает массивом в том же порядке.
+            # Ошибки отдельных операций не прерывают пакет: их проверяет вызывающий
+            # через check_gql_errors, чтобы одна неудачная операция не отменяла остальные
+            if not isinstance(resp_json, list) or len(resp_json) != len(ops):
+                raise GQLException(f"Неверный формат ответа на пакетный запрос: {str(resp_json)[:200]}")
+            return resp_json
+        self.check_gql_errors(resp_json)
+        return resp_json
+
+    def check_gql_errors(self, item: JsonType):
+        """Выбросить GQLException, если ответ на операцию содержит ошибки."""
+        if errors := (item.get('errors') if isinstance(item, dict) else None):
+            error_msg = errors[0].get("message", "Неизвестная GQL ошибка")
+            self.log(f"GQL ошибка: {error_msg}")
+            # Проверяем специфичную ошибку целостности
+            if "integrity" in error_msg.lower():
+                self.log("Ошибка целостности. Попробуйте обновить Client-Integrity или использовать cookies.")
+            raise GQLException(error_msg)
 
     async def stop(self):
         self._is_running = False
         if self._watching_task: 
             self._watching_task.cancel()
             # Не ждем завершения задачи, просто отменяем
+        if self._spade_cache_task and not self._spade_cache_task.done():
+            # Отменяем отложенную запись (уже начатая запись будет дождана)
+            # и сохраняем изменения кэша сразу
+            self._spade_cache_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._spade_cache_task
+            await asyncio.to_thread(self._save_spade_cache)
         if self._session: 
             await self._session.close()
         self.log("Работник остановлен.")
@@ -532,16 +789,18 @@ class AccountWorker:
         """Получить список всех кампаний."""
         self.log("Получение списка кампаний...")
         try:
-            self.log("Отправка запроса ViewerDropsDashboard...")
-            res = await self.gql_request(GQL_OPERATIONS["ViewerDropsDashboard"])
-            self.log("Запрос ViewerDropsDashboard успешен")
+            # Кампании и прогресс из инвентаря получаем одним пакетным запросом
+            self.log("Отправка запросов ViewerDropsDashboard и Inventory...")
+            res, inv_res = await self.gql_request([
+                GQL_OPERATIONS["ViewerDropsDashboard"],
+                GQL_OPERATIONS["Inventory"],
+            ])
+            self.check_gql_errors(res)
+            self.check_gql_errors(inv_res)
+            self.log("Запросы ViewerDropsDashboard и Inventory успешны")
             all_campaigns_data = res["data"]["currentUser"]["dropCampaigns"] or []
             self.log(f"Получено {len(all_campaigns_data)} кампаний из ViewerDropsDashboard")
             
-            # Получаем прогресс из инвентаря
-            self.log("Отправка запроса Inventory...")
-            inv_res = await self.gql_request(GQL_OPERATIONS["Inventory"])
-            self.log("Запрос Inventory успешен")
             inventory_data = inv_res["data"]["currentUser"]["inventory"]
             progress_data = {c['id']: c for c in (inventory_data["dropCampaignsInProgress"] or [])}
             self.log(f"Получено {len(progress_data)} кампаний из Inventory")
@@ -550,7 +809,7 @@ class AccountWorker:
             for campaign in all_campaigns_data:
                 campaign_id = campaign.get('id')
                 if campaign_id and campaign_id in progress_data:
-                    self.log(f"Объединение данных для кампании {campaign_id}")
+                    self.debug("Объединение данных для кампании %s", campaign_id)
                     # Объединяем данные кампании с данными прогресса
                     campaign['self'] = progress_data[campaign_id].get('self', {})
                     progress_drops = {d['id']: d for d in progress_data[campaign_id].get('timeBasedDrops', [])}
@@ -561,17 +820,20 @@ class AccountWorker:
 
             # Создаем объекты кампаний только для активных
             self.inventory = [DropsCampaign(self, c) for c in final_campaigns if c.get("status") == "ACTIVE"]
+            self._game_by_name = {c.game.name: c.game for c in self.inventory if c.game}
+            self._update_earnable_games()
             self.log(f"Найдено {len(self.inventory)} активных кампаний.")
             
-            # Логируем информацию о каждой кампании
-            for campaign in self.inventory:
-                earnable = "✅" if campaign.can_earn() else "❌"
-                drops_info = []
-                for drop in campaign.timed_drops.values():
-                    claimed = "✓" if drop.is_claimed else "○"
-                    drops_info.append(f"{claimed}{drop.current_minutes}/{drop.required_minutes}min")
-                drops_text = ", ".join(drops_info) if drops_info else "No drops"
-                self.log(f"  - [{earnable}] {campaign.name} ({drops_text})")
+            # Логируем информацию о каждой кампании (только в режиме DEBUG)
+            if logger.isEnabledFor(logging.DEBUG):
+                for campaign in self.inventory:
+                    earnable = "✅" if campaign.can_earn() else "❌"
+                    drops_info = []
+                    for drop in campaign.timed_drops.values():
+                        claimed = "✓" if drop.is_claimed else "○"
+                        drops_info.append(f"{claimed}{drop.current_minutes}/{drop.required_minutes}min")
+                    drops_text = ", ".join(drops_info) if drops_info else "No drops"
+                    self.debug("  - [%s] %s (%s)", earnable, campaign.name, drops_text)
             
             # Автоматически забираем доступные дропы
             for campaign in self.inventory:
@@ -582,50 +844,76 @@ class AccountWorker:
         except (MinerException, GQLException) as e:
             self.log(f"Не удалось получить инвентарь: {e}")
             self.inventory = []
+            self._game_by_name = {}
+            self._earnable_games = set()
+
+    def _update_earnable_games(self):
+        """Пересобрать набор игр с доступными для получения дропами."""
+        self._earnable_games = {c.game for c in self.inventory if c.game and c.can_earn()}
 
-    async def fetch_channels(self):
-        """Найти каналы для игр из приоритетного списка."""
+    async def fetch_channels(self, *, quiet: bool = False):
+        """Найти каналы для игр из приоритетного списка.
+
+        С quiet=True ход поиска пишется только в DEBUG (для фоновой предзагрузки).
+        """
+        log = (lambda message: self.debug("%s", message)) if quiet else self.log
         self.channels = {}
         priority_games = self.settings.get("priority", [])
         
         if not priority_games:
-            self.log("Нет приоритетных игр для поиска каналов.")
+            log("Нет приоритетных игр для поиска каналов.")
             return
             
+        # Собираем запросы для всех игр и отправляем их одним пакетом
+        game_names: list[str] = []
+        operations: list[JsonType] = []
         for game_name in priority_games:
-            self.log(f"Поиск каналов для игры: {game_name}")
+            log(f"Поиск каналов для игры: {game_name}")
             # Находим объект Game по имени
-            game_obj = None
-            for campaign in self.inventory:
-                if campaign.game and campaign.game.name == game_name:
-                    game_obj = campaign.game
-                    break
-                    
+            game_obj = self._game_by_name.get(game_name)
             if not game_obj:
-                self.log(f"Игра {game_name} не найдена среди кампаний.")
+                log(f"Игра {game_name} не найдена среди кампаний.")
                 continue
-                
+
+            game_names.append(game_name)
+            operations.append(
+                GQL_OPERATIONS["GameDirectory"].with_variables({
+                    "slug": game_obj.slug, 
+                    "options": {"tags": ["Drops Enabled"]}
+                })
+            )
+
+        if operations:
             try:
-                res = await self.gql_request(
-                    GQL_OPERATIONS["GameDirectory"].with_variables({
-                        "slug": game_obj.slug, 
-                        "options": {"tags": ["Drops Enabled"]}
-                    })
-                )
+                results = await self.gql_request(operations)
+            except GQLException as e:
+                log(f"Ошибка поиска каналов для {', '.join(game_names)}: {e}")
+                results = []
+
+            for game_name, res in zip(game_names, results):
+                # Ошибка по одной игре не мешает искать каналы для остальных
+                try:
+                    self.check_gql_errors(res)
+                except GQLException as e:
+                    log(f"Ошибка поиска каналов для {game_name}: {e}")
+                    continue
                 streams = res.get("data", {}).get("game", {}).get("streams", {}).get("edges", [])[:10] # Берем больше каналов
-                self.log(f"Найдено {len(streams)} стримов для {game_name}")
+                log(f"Найдено {len(streams)} стримов для {game_name}")
                 
                 for stream in streams:
                     node = stream.get("node")
                     if node and node.get("broadcaster"):
                         channel = Channel.from_directory(self, node)
                         self.channels[channel.id] = channel
-                        self.log(f"Добавлен канал: {channel.display_name} ({channel.login})")
-                        
-            except GQLException as e:
-                self.log(f"Ошибка поиска каналов для {game_name}: {e}")
+                        self.debug("Добавлен канал: %s (%s)", channel.display_name, channel.login)
                 
-        self.log(f"Всего найдено {len(self.channels)} потенциальных каналов.")
+        log(f"Всего найдено {len(self.channels)} потенциальных каналов.")
+
+    async def refresh_all_streams(self) -> dict[int, bool]:
+        """Параллельно обновить информацию о стримах всех найденных каналов."""
+        channels = list(self.channels.values())
+        results = await asyncio.gather(*(ch.update_stream() for ch in channels), return_exceptions=True)
+        return {ch.id: result is True for ch, result in zip(channels, results)}
 
     def watch(self, channel: "Channel"):
         """Начать просмотр канала."""
@@ -633,32 +921,61 @@ class AccountWorker:
             return
         self.stop_watching()
         self.watching_channel = channel
+        self._watch_stopped.clear()
         self._watching_task = asyncio.create_task(self._watch_loop(channel))
         self.log(f"Начат просмотр канала: {channel.display_name}")
 
     def stop_watching(self):
         """Остановить просмотр."""
-        if self._watching_task:
-            self._watching_task.cancel()
+        # Будим текущий цикл просмотра вместо отмены задачи,
+        # а для следующего цикла заводим новое событие
+        self._switch_event.set()
+        self._switch_event = asyncio.Event()
         self.watching_channel = None
+        self._watch_stopped.set()
         self.log("Просмотр остановлен.")
 
     async def _watch_loop(self, channel: "Channel"):
         """Цикл имитации просмотра."""
+        switch_event = self._switch_event
         try:
             if not await channel.update_stream():
                 self.log(f"{channel.display_name} офлайн.")
                 return # Просто выходим, не переключаемся
             
+            intervals = 0
+            skipping = False
             while self._is_running and self.watching_channel == channel:
-                # Отправляем watch-событие
-                success = await channel.send_watch()
-                if not success:
-                    self.log(f"Ошибка отправки watch для {channel.display_name}.")
-                    # Не останавливаемся, пробуем снова через интервал
-                
-                self.log(f"Watch-событие отправлено для {channel.display_name}. Следующая попытка через {WATCH_INTERVAL}с.")
-                await asyncio.sleep(WATCH_INTERVAL)
+                if intervals and intervals % STREAM_REFRESH_INTERVALS == 0:
+                    # Стример мог сменить игру или закончить эфир
+                    if not await channel.update_stream():
+                        self.log(f"{channel.display_name} офлайн.")
+                        return
+                intervals += 1
+
+                game = channel._stream.game if channel._stream else None
+                if game is not None and game not in self._earnable_games:
+                    # Не тратим запрос, если игра стрима не дает дропов ни в одной кампании
+                    if not skipping:
+                        skipping = True
+                        self.log(f"Игра {game.name} на {channel.display_name} не дает дропов, watch-события приостановлены до смены игры.")
+                    else:
+                        self.debug("Игра %s на %s не дает дропов, watch пропущен", game.name, channel.login)
+                else:
+                    skipping = False
+                    # Отправляем watch-событие
+                    success = await channel.send_watch()
+                    if not success:
+                        self.log(f"Ошибка отправки watch для {channel.display_name}.")
+                        # Не останавливаемся, пробуем снова через интервал
+                    
+                    self.log(f"Watch-событие отправлено для {channel.display_name}. Следующая попытка через {WATCH_INTERVAL}с.")
+                # Ждем интервал, но сразу выходим по сигналу остановки/смены канала
+                try:
+                    await asyncio.wait_for(switch_event.wait(), timeout=WATCH_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    pass
                 
         except asyncio.CancelledError:
             self.log(f"Цикл просмотра для {channel.display_name} отменен.")
@@ -667,3 +984,4 @@ class AccountWorker:
         finally:
             if self.watching_channel == channel:
                 self.watching_channel = None
+                self._watch_stopped.set()
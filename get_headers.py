@@ -1,30 +1,29 @@
 import asyncio
-import json
 from playwright.async_api import async_playwright
+from core import write_json_file
 
 async def main():
     headers_found = asyncio.Future()
 
-    async def handle_route(route):
-        request = route.request
-        try:
-            if "gql.twitch.tv/gql" in request.url and request.method == "POST":
-                all_headers = request.headers
-                client_integrity = all_headers.get("client-integrity")
-                client_version = all_headers.get("client-version")
-                device_id = all_headers.get("x-device-id")
-                if client_integrity and client_version and device_id and not headers_found.done():
-                    print("\n✓ УСПЕХ! Необходимые заголовки перехвачены!")
-                    print("Теперь вы можете закрыть и браузер, и этот скрипт (Ctrl+C).")
-                    headers_found.set_result({
-                        "Client-Integrity": client_integrity,
-                        "Client-Version": client_version,
-                        "X-Device-Id": device_id
-                    })
-            await route.continue_()
-        except Exception:
-            if not route.is_handled():
-                await route.continue_()
+    async def on_request(request):
+        # Событие только для чтения: запрос не приостанавливается, continue_() не нужен
+        # Сначала самые дешевые проверки; после перехвата заголовков выходим сразу
+        if headers_found.done() or request.method != "POST" or "gql.twitch.tv/gql" not in request.url:
+            return
+        # header_value смотрит фактические заголовки запроса, а не предварительные
+        # request.headers, в которых части заголовков может не быть.
+        # При первом вызове Playwright один раз запрашивает их у браузера (rawRequestHeaders)
+        client_integrity = await request.header_value("client-integrity")
+        client_version = await request.header_value("client-version")
+        device_id = await request.header_value("x-device-id")
+        if client_integrity and client_version and device_id and not headers_found.done():
+            print("\n✓ УСПЕХ! Необходимые заголовки перехвачены!")
+            print("Теперь вы можете закрыть и браузер, и этот скрипт (Ctrl+C).")
+            headers_found.set_result({
+                "Client-Integrity": client_integrity,
+                "Client-Version": client_version,
+                "X-Device-Id": device_id
+            })
 
     print("--- Помощник перехвата заголовков из вашего браузера MS Edge ---")
     print("\nИНСТРУКЦИЯ:")
@@ -48,13 +47,15 @@ async def main():
             print("Пожалуйста, убедитесь, что вы закрыли все окна Edge и запустили start_edge.bat.")
             return
 
-        await page.route("**/*", handle_route)
+        # Только наблюдаем за запросами, не перехватывая их
+        page.on("request", on_request)
         print("\nСлушаю сетевую активность... Пожалуйста, войдите в Twitch в открытом окне.")
 
         found_headers = await headers_found
+        # Дальше запросы страницы нас не интересуют
+        page.remove_listener("request", on_request)
 
-        with open("headers.json", "w") as f:
-            json.dump(found_headers, f, indent=2)
+        write_json_file("headers.json", found_headers)
         
         print("\n✓ Заголовки успешно сохранены в файл headers.json!")
         print("--- Работа помощника завершена. ---")
@@ -5,25 +5,43 @@ import sys
 import os
 from contextlib import suppress
 from datetime import datetime
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from core import AccountWorker
+from queue import SimpleQueue
+from core import AccountWorker, read_json_file
 
-# Настройка логирования в файл и консоль
+# Настройка логирования в файл и консоль.
+# Запись выполняется в отдельном потоке через очередь, чтобы не блокировать цикл событий
 log_date_format = '%Y-%m-%d %H:%M:%S'
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)-8s - %(message)s',
-    datefmt=log_date_format,
-    handlers=[
-        logging.FileHandler('farmer.log', mode='w', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)-8s - %(message)s', datefmt=log_date_format)
+log_handlers = [
+    logging.FileHandler('farmer.log', mode='w', encoding='utf-8'),
+    logging.StreamHandler(sys.stdout)
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+# QueueHandler.prepare() форматирует запись перед постановкой в очередь, поэтому
+# оставляем ему только текст сообщения - остальное добавят обработчики слушателя
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 
 async def async_input(prompt: str) -> str:
     """Асинхронный ввод с помощью отдельного потока."""
     return await asyncio.to_thread(input, prompt)
 
+async def cancel_task(task: asyncio.Task | None):
+    """Отменить фоновую задачу и дождаться ее завершения."""
+    if task is None:
+        return
+    task.cancel()
+    with suppress(asyncio.CancelledError, Exception):
+        await task
+
 async def interactive_mode(worker: AccountWorker):
     """Интерактивный режим выбора кампании и канала."""
     print("\n--- Интерактивный режим ---")
@@ -43,27 +61,46 @@ async def interactive_mode(worker: AccountWorker):
         print("Нет активных кампаний.")
         return
         
+    lines = []
     for i, campaign in enumerate(campaigns, 1):
         status = "✅" if campaign.can_earn() else "❌"
         game_name = campaign.game.name if campaign.game else "N/A"
-        print(f"{i}. [{status}] {campaign.name} (Игра: {game_name})")
+        lines.append(f"{i}. [{status}] {campaign.name} (Игра: {game_name})")
+    sys.stdout.write("\n".join(lines) + "\n")
+
+    # Пока пользователь выбирает, заранее ищем каналы для первой доступной кампании
+    prefetch_candidate = next((c for c in campaigns if c.can_earn()), None)
+    prefetch = None
+    if prefetch_candidate:
+        worker.settings["priority"] = [prefetch_candidate.game.name]
+        # quiet: логи поиска не должны печататься поверх приглашения к вводу
+        prefetch = asyncio.create_task(worker.fetch_channels(quiet=True))
 
     # 3. Выбрать кампанию
+    n_camp = len(campaigns)
     try:
-        choice = int(await async_input(f"\nВыберите кампанию (1-{len(campaigns)}): ")) - 1
-        if not 0 <= choice < len(campaigns):
+        choice = int(await async_input(f"\nВыберите кампанию (1-{n_camp}): ")) - 1
+        if not 0 <= choice < n_camp:
             print("Неверный выбор.")
+            await cancel_task(prefetch)
             return
         selected_campaign = campaigns[choice]
         print(f"Выбрана кампания: {selected_campaign.name}")
     except ValueError:
         print("Неверный ввод.")
+        await cancel_task(prefetch)
         return
 
     # 4. Найти каналы для игры этой кампании
-    print(f"\nПоиск каналов для игры: {selected_campaign.game.name}...")
-    worker.settings["priority"] = [selected_campaign.game.name] # Устанавливаем приоритет
-    await worker.fetch_channels()
+    if prefetch and selected_campaign is prefetch_candidate:
+        # Каналы уже ищутся (или найдены) в фоне
+        await prefetch
+        worker.log(f"Всего найдено {len(worker.channels)} потенциальных каналов.")
+    else:
+        await cancel_task(prefetch)
+        print(f"\nПоиск каналов для игры: {selected_campaign.game.name}...")
+        worker.settings["priority"] = [selected_campaign.game.name] # Устанавливаем приоритет
+        await worker.fetch_channels()
     
     if not worker.channels:
         print("Каналы для этой игры не найдены.")
@@ -71,17 +108,18 @@ async def interactive_mode(worker: AccountWorker):
 
     # 5. Показать список каналов
     print("\n--- Доступные каналы ---")
-    channels_list = list(worker.channels.values())
-    for i, channel in enumerate(channels_list, 1):
-        print(f"{i}. {channel.display_name} ({channel.login})")
+    # Список каналов не копируем: выводим и выбираем прямо из словаря (порядок вставки сохраняется)
+    lines = [f"{i}. {channel.display_name} ({channel.login})" for i, channel in enumerate(worker.channels.values(), 1)]
+    sys.stdout.write("\n".join(lines) + "\n")
 
     # 6. Выбрать канал
+    n_ch = len(worker.channels)
     try:
-        choice = int(await async_input(f"\nВыберите канал (1-{len(channels_list)}): ")) - 1
-        if not 0 <= choice < len(channels_list):
+        choice = int(await async_input(f"\nВыберите канал (1-{n_ch}): ")) - 1
+        if not 0 <= choice < n_ch:
             print("Неверный выбор.")
             return
-        selected_channel = channels_list[choice]
+        selected_channel = next(islice(worker.channels.values(), choice, None))
         print(f"Выбран канал: {selected_channel.display_name}")
     except ValueError:
         print("Неверный ввод.")
@@ -94,9 +132,7 @@ async def interactive_mode(worker: AccountWorker):
     # 8. Запустить цикл просмотра
     try:
         # Ждем завершения просмотра (или Ctrl+C для остановки)
-        while worker.watching_channel and worker._is_running:
-            await asyncio.sleep(10) # Проверяем каждые 10 секунд
-            # Можно добавить вывод прогресса здесь, если нужно
+        await worker._watch_stopped.wait()
     except KeyboardInterrupt:
         print("\nПросмотр остановлен пользователем.")
     finally:
@@ -109,8 +145,7 @@ async def main():
     Path("cookies").mkdir(exist_ok=True)
 
     try:
-        with open('accounts.json', 'r', encoding='utf-8') as f:
-            accounts_config = json.load(f)
+        accounts_config = read_json_file('accounts.json')
     except FileNotFoundError:
         print("!!! FATAL: accounts.json not found!")
         return
@@ -150,3 +185,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"\nКритическая ошибка: {e}")
         logging.error("Критическая ошибка", exc_info=True)
+    finally:
+        # Дописываем оставшиеся в очереди записи
+        log_listener.stop()
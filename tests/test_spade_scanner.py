@@ -0,0 +1,44 @@
+import unittest
+
+from core import _SpadeScanner
+
+SEGMENT = "https://video-edge-a1b2.abc.hls.ttvnw.net/v1/segment/seg.ts?token=abc&sig=def"
+KEY = '"spade_url":"https://video-edge-a1b2.abc.hls.ttvnw.net/v1/playlist/spade"'
+
+
+def scan(data: bytes, *split_at: int):
+    scanner = _SpadeScanner()
+    bounds = [0, *split_at, len(data)]
+    for start, end in zip(bounds, bounds[1:]):
+        found = scanner.feed(data[start:end])
+        if found:
+            return found
+    return scanner.finish()
+
+
+class SpadeScannerTest(unittest.TestCase):
+    def assert_every_split(self, page: str, expected: str):
+        data = page.encode()
+        for offset in range(len(data) + 1):
+            with self.subTest(offset=offset):
+                self.assertEqual(scan(data, offset), expected)
+
+    def test_segment_link_with_query(self):
+        self.assert_every_split(f"<a>{SEGMENT}</a>" + "x" * 64, SEGMENT)
+
+    def test_segment_link_at_end_of_page(self):
+        self.assert_every_split(f"<a>{SEGMENT}", SEGMENT)
+
+    def test_key_preferred_over_earlier_segment_link(self):
+        page = f"<a>{SEGMENT}</a>" + "x" * 2000 + KEY
+        self.assert_every_split(page, KEY.split('"')[3])
+
+    def test_key_is_case_insensitive(self):
+        self.assert_every_split('{"SPADE_URL": "https://u/"}', "https://u/")
+
+    def test_no_match(self):
+        self.assertIsNone(scan(b"<html>" + b"x" * 5000 + b"</html>", 2500))
+
+
+if __name__ == "__main__":
+    unittest.main()